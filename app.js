@@ -45,15 +45,15 @@ async function loadEncryptionConfig() {
     }
 }
 
-function decryptData(encryptedBase64, password, config) {
+function decryptData(encryptedBuffer, password, config) {
     try {
-        // Convert base64 strings to CryptoJS WordArrays
+        // Convert base64 salt/IV and the raw ciphertext bytes to CryptoJS WordArrays
         const salt = CryptoJS.enc.Base64.parse(config.salt);
         const iv = CryptoJS.enc.Base64.parse(config.iv);
-        const ciphertext = CryptoJS.enc.Base64.parse(encryptedBase64);
+        const ciphertext = CryptoJS.lib.WordArray.create(new Uint8Array(encryptedBuffer));
 
         // Derive key using PBKDF2 (matching Python's settings)
-        // pycryptodome uses SHA1 by default for PBKDF2
+        // convert_data.py derives the key with PBKDF2-HMAC-SHA1
         const key = CryptoJS.PBKDF2(password, salt, {
             keySize: 256 / 32,  // 256 bits = 8 words
             iterations: config.iterations,
@@ -112,7 +112,7 @@ async function loadEncryptedThreads() {
         if (!response.ok) {
             throw new Error('Failed to load encrypted threads');
         }
-        return await response.text();
+        return await response.arrayBuffer();
     } catch (error) {
         console.error('Error loading encrypted threads:', error);
         return null;
@@ -17,23 +17,37 @@ Output files (in data/):
     - encryption_config.json (salt and IV for decryption)
 """
 
+import numpy as np
 import pandas as pd
 import json
 import argparse
 import base64
+import hashlib
 import os
 from pathlib import Path
 from datetime import datetime
 
 # Encryption imports
 try:
-    from Crypto.Cipher import AES
-    from Crypto.Protocol.KDF import PBKDF2
-    from Crypto.Util.Padding import pad
-    from Crypto.Random import get_random_bytes
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 except ImportError:
-    print("ERROR: pycryptodome is required for encryption.")
-    print("Install it with: pip install pycryptodome")
+    print("ERROR: cryptography is required for encryption.")
+    print("Install it with: pip install cryptography")
+    exit(1)
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:
+    print("ERROR: pyarrow is required for reading CSV files.")
+    print("Install it with: pip install pyarrow")
+    exit(1)
+
+try:
+    import orjson
+except ImportError:
+    print("ERROR: orjson is required for JSON serialization.")
+    print("Install it with: pip install orjson")
     exit(1)
 
 # Paths
@@ -45,46 +59,148 @@ OUTPUT_DIR = SCRIPT_DIR / "data"
 ANNOTATED_CSV = WEBAPP_DATA / "all_annotated.csv"
 THREADS_CSV = WEBAPP_DATA / "all_threads_anonymized.csv"
 
+# CSV column types (declared up front so the reader skips type inference).
+# Low-cardinality text columns are dictionary-encoded, becoming pandas
+# categories whose records all share one string object per value.
+# Nullable id columns are read as float64, since pandas writes them as
+# "1.0" once they hold a missing value, then cast to Int64 after loading.
+# Flag columns are read as strings and converted to boolean in pandas, so
+# the reader never guesses booleans for numeric columns.
+ARROW_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+ANNOTATED_COLUMN_TYPES = {
+    'thread_id': pa.float64(),
+    'vaccine_related': pa.string(),
+    'vaccine_types': pa.string(),
+    'behavior_change_occurred': pa.string(),
+    'behavior_change_change_type': ARROW_CATEGORY,
+    'behavior_change_initial_stance': ARROW_CATEGORY,
+    'behavior_change_final_stance': ARROW_CATEGORY,
+    'behavior_change_influence_type': ARROW_CATEGORY,
+    'behavior_change_confidence': ARROW_CATEGORY,
+    'behavior_change_key_turning_point_post_number': pa.float64(),
+    'behavior_change_influenced_by_post_number': pa.float64(),
+    'model': ARROW_CATEGORY,
+    'timestamp': pa.string(),
+    'tokens_used': pa.float64(),
+    'cost_usd': pa.float64(),
+}
+ANNOTATED_INT_COLUMNS = ['thread_id', 'tokens_used']
+ANNOTATED_BOOL_COLUMNS = ['vaccine_related', 'behavior_change_occurred']
+THREADS_COLUMNS = [
+    'thread_id', 'post_id', 'author_role', 'timestamp', 'content',
+    'sentiment', 'has_vaccine_keyword', 'replies_to_post_number',
+]
+THREADS_COLUMN_TYPES = {
+    'thread_id': pa.float64(),
+    'post_id': pa.float64(),
+    'author_role': ARROW_CATEGORY,
+    'timestamp': pa.string(),
+    'content': pa.string(),
+    'sentiment': ARROW_CATEGORY,
+    'has_vaccine_keyword': pa.string(),
+    'replies_to_post_number': pa.float64(),
+}
+THREADS_INT_COLUMNS = ['thread_id', 'post_id', 'replies_to_post_number']
+THREADS_BOOL_COLUMNS = ['has_vaccine_keyword']
+
+# Spellings accepted in flag columns ("1.0"/"0.0" from float-typed writers)
+CSV_BOOL_VALUES = {
+    'True': True, 'TRUE': True, 'true': True, '1': True, '1.0': True,
+    'False': False, 'FALSE': False, 'false': False, '0': False, '0.0': False,
+}
+
+# Nullable pandas dtypes for Arrow columns that may contain nulls
+ARROW_TO_PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
 # Output files
 ANNOTATED_JSON = OUTPUT_DIR / "annotated.json"
 THREADS_ENCRYPTED = OUTPUT_DIR / "threads.encrypted"
 ENCRYPTION_CONFIG = OUTPUT_DIR / "encryption_config.json"
 
+# Encryption settings (must match decryptData() in app.js)
+AES_BLOCK_SIZE = algorithms.AES.block_size // 8
+PBKDF2_HASH = 'sha1'
+PBKDF2_ITERATIONS = 100000
+
+# Plaintext bytes encrypted per write (a multiple of the AES block size)
+ENCRYPT_CHUNK_SIZE = 64 * 1024
+
 
 # ============================================================================
 # Encryption Functions
 # ============================================================================
 
-def encrypt_data(data_str: str, password: str) -> tuple:
+def init_cipher(password: str, salt: bytes) -> tuple:
+    """
+    Derive the AES key for a password and salt, and build a cipher factory.
+
+    The key is derived once; the factory only creates a new CBC mode per IV,
+    so several payloads can be encrypted under one key without re-deriving it.
+
+    Args:
+        password: User password
+        salt: Random PBKDF2 salt
+
+    Returns:
+        tuple: (key, cipher_factory) where cipher_factory(iv) returns a Cipher
+    """
+    # Derive key from password using PBKDF2-HMAC-SHA1 (OpenSSL via hashlib)
+    # SHA1 matches the CryptoJS hasher used by the viewer for decryption
+    key = hashlib.pbkdf2_hmac(PBKDF2_HASH, password.encode('utf-8'), salt,
+                              PBKDF2_ITERATIONS, dklen=32)
+    algorithm = algorithms.AES(key)
+
+    # OpenSSL EVP cipher, uses AES-NI where available
+    def cipher_factory(iv: bytes) -> Cipher:
+        return Cipher(algorithm, modes.CBC(iv))
+
+    return key, cipher_factory
+
+
+def encrypt_to_file(encryptor, data_bytes: bytes, output_path: Path):
+    """
+    Encrypt data with PKCS#7 padding and write the raw ciphertext to a file.
+
+    The ciphertext is written in chunks, so only one chunk of ciphertext is
+    held in memory at a time.
+    """
+    data = memoryview(data_bytes)
+    pad_len = AES_BLOCK_SIZE - len(data) % AES_BLOCK_SIZE
+
+    with open(output_path, 'wb') as f:
+        for start in range(0, len(data), ENCRYPT_CHUNK_SIZE):
+            f.write(encryptor.update(data[start:start + ENCRYPT_CHUNK_SIZE]))
+        # PKCS#7 padding
+        f.write(encryptor.update(bytes([pad_len]) * pad_len))
+        f.write(encryptor.finalize())
+
+
+def encrypt_data(data_bytes: bytes, password: str, output_path: Path) -> tuple:
     """
     Encrypt data using AES-256-CBC with PBKDF2 key derivation.
 
     Args:
-        data_str: JSON string to encrypt
+        data_bytes: UTF-8 encoded JSON to encrypt
         password: User password
+        output_path: File to write the ciphertext to
 
     Returns:
-        tuple: (encrypted_base64, salt_base64, iv_base64)
+        tuple: (salt_base64, iv_base64)
     """
     # Generate random salt and IV
-    salt = get_random_bytes(16)
-    iv = get_random_bytes(16)
+    salt = os.urandom(16)
+    iv = os.urandom(16)
 
-    # Derive key from password using PBKDF2
-    # Using 100000 iterations for security (matching CryptoJS default)
-    key = PBKDF2(password, salt, dkLen=32, count=100000)
+    _, cipher_factory = init_cipher(password, salt)
+    encrypt_to_file(cipher_factory(iv).encryptor(), data_bytes, output_path)
 
-    # Create cipher and encrypt
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    padded_data = pad(data_str.encode('utf-8'), AES.block_size)
-    encrypted = cipher.encrypt(padded_data)
-
-    # Encode to base64 for storage
-    encrypted_b64 = base64.b64encode(encrypted).decode('utf-8')
     salt_b64 = base64.b64encode(salt).decode('utf-8')
     iv_b64 = base64.b64encode(iv).decode('utf-8')
 
-    return encrypted_b64, salt_b64, iv_b64
+    return salt_b64, iv_b64
 
 
 # ============================================================================
@@ -93,90 +209,152 @@ def encrypt_data(data_str: str, password: str) -> tuple:
 
 def parse_vaccine_types(value):
     """Parse vaccine_types field from JSON string to list."""
-    if pd.isna(value) or value == "":
-        return []
-    try:
-        if isinstance(value, str):
-            return json.loads(value)
+    # Cheap checks first: most rows are empty or "[]" and need no JSON parse
+    if isinstance(value, list):
         return value
-    except json.JSONDecodeError:
-        return [value]
+    if isinstance(value, str):
+        if value == "" or value == "[]":
+            return []
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return [value]
+    if pd.isna(value):
+        return []
+    return value
 
 
 def convert_annotated(df):
     """Convert annotated DataFrame to list of dicts with parsed fields."""
-    records = []
     parse_errors = []
 
-    for idx, row in df.iterrows():
-        record = row.to_dict()
-
-        # Parse vaccine_types
+    def parse_or_record(idx, value):
         try:
-            record['vaccine_types'] = parse_vaccine_types(row['vaccine_types'])
+            return parse_vaccine_types(value)
         except Exception as e:
             parse_errors.append(f"Row {idx}: vaccine_types parse error - {e}")
-            record['vaccine_types'] = []
+            return []
 
-        # Convert numpy types to Python types
-        for key, value in record.items():
-            try:
-                if pd.isna(value):
-                    record[key] = None
-                    continue
-            except (ValueError, TypeError):
-                pass
+    vaccine_types = [parse_or_record(idx, value) for idx, value in df['vaccine_types'].items()]
 
-            if hasattr(value, 'item'):
-                record[key] = value.item()
+    # Normalize NaN -> None and numpy scalars -> Python types in one pass
+    df = df.astype(object)
+    df = df.where(df.notna(), None)
+    df['vaccine_types'] = pd.Series(vaccine_types, index=df.index, dtype=object)
 
-        records.append(record)
+    records = df.to_dict(orient='records')
 
     return records, parse_errors
 
 
+def _none_where_missing(series, mask):
+    """Cast series to object dtype, replacing entries outside mask with None."""
+    return series.astype(object).where(mask, None)
+
+
 def convert_threads(df):
     """Convert threads DataFrame to dict grouped by thread_id."""
-    threads = {}
-    df = df.sort_values(['thread_id', 'timestamp'])
-
-    for thread_id, group in df.groupby('thread_id'):
-        posts = []
-        for _, row in group.iterrows():
-            post = {
-                'post_id': int(row['post_id']) if pd.notna(row['post_id']) else None,
-                'author_role': row['author_role'] if pd.notna(row['author_role']) else None,
-                'timestamp': str(row['timestamp']) if pd.notna(row['timestamp']) else None,
-                'content': str(row['content']) if pd.notna(row['content']) else "",
-                'sentiment': row['sentiment'] if pd.notna(row['sentiment']) else 'neutral',
-                'has_vaccine_keyword': bool(row['has_vaccine_keyword']) if pd.notna(row['has_vaccine_keyword']) else False,
-                'replies_to_post_number': int(row['replies_to_post_number']) if pd.notna(row['replies_to_post_number']) else None
-            }
-            posts.append(post)
-        threads[str(int(thread_id))] = posts
+    df = df[df['thread_id'].notna()].sort_values(['thread_id', 'timestamp'], ignore_index=True)
+
+    # Fill missing sentiment within the categorical, so posts share one string per value
+    sentiment = df['sentiment']
+    if isinstance(sentiment.dtype, pd.CategoricalDtype) and 'neutral' not in sentiment.cat.categories:
+        sentiment = sentiment.cat.add_categories('neutral')
+
+    # Coerce each column once instead of per cell
+    posts = pd.DataFrame({
+        'post_id': _none_where_missing(df['post_id'].astype('Int64'), df['post_id'].notna()),
+        'author_role': _none_where_missing(df['author_role'], df['author_role'].notna()),
+        'timestamp': _none_where_missing(df['timestamp'].astype(str), df['timestamp'].notna()),
+        'content': df['content'].fillna('').astype(str),
+        'sentiment': sentiment.fillna('neutral').astype(object),
+        'has_vaccine_keyword': df['has_vaccine_keyword'].astype('boolean').fillna(False).astype(bool),
+        'replies_to_post_number': _none_where_missing(
+            df['replies_to_post_number'].astype('Int64'), df['replies_to_post_number'].notna()),
+    })
+    records = posts.to_dict(orient='records')
+
+    # Rows are sorted by thread_id, so each thread is a contiguous slice
+    thread_ids, starts = np.unique(df['thread_id'].to_numpy(dtype='int64'), return_index=True)
+    ends = np.append(starts[1:], len(records))
+
+    threads = {
+        str(thread_id): records[start:end]
+        for thread_id, start, end in zip(thread_ids.tolist(), starts.tolist(), ends.tolist())
+    }
 
     return threads
 
 
-def validate_data(annotated_records, threads_dict, annotated_df, threads_df):
+def read_csv_arrow(csv_path, column_types, include_columns=(), int_columns=(), bool_columns=()):
+    """Read a CSV with pyarrow's multithreaded reader into a DataFrame."""
+    table = pacsv.read_csv(
+        csv_path,
+        # Post content and reasoning text can contain quoted newlines
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types,
+            include_columns=list(include_columns),
+            strings_can_be_null=True,
+        ),
+    )
+    df = table.to_pandas(types_mapper=ARROW_TO_PANDAS_TYPES.get)
+    for col in int_columns:
+        df[col] = df[col].astype('Int64')
+    for col in bool_columns:
+        df[col] = df[col].map(CSV_BOOL_VALUES).astype('boolean')
+    return df
+
+
+def load_and_convert_annotated(csv_path):
+    """
+    Load and convert the annotated CSV.
+
+    Only the records and a small summary of the DataFrame are returned, as
+    validation needs nothing else from it.
+
+    Returns:
+        tuple: (records, parse_errors, summary) where summary holds the row and
+        column counts and the unique thread_ids
+    """
+    df = read_csv_arrow(csv_path, ANNOTATED_COLUMN_TYPES,
+                        int_columns=ANNOTATED_INT_COLUMNS, bool_columns=ANNOTATED_BOOL_COLUMNS)
+    records, parse_errors = convert_annotated(df)
+    summary = {
+        'rows': len(df),
+        'columns': len(df.columns),
+        'thread_ids': df['thread_id'].dropna().astype('int64').unique(),
+    }
+    return records, parse_errors, summary
+
+
+def load_and_convert_threads(csv_path):
+    """Load and convert the threads CSV."""
+    df = read_csv_arrow(csv_path, THREADS_COLUMN_TYPES, THREADS_COLUMNS,
+                        THREADS_INT_COLUMNS, THREADS_BOOL_COLUMNS)
+    return df, convert_threads(df)
+
+
+def validate_data(annotated_records, threads_dict, annotated_summary, threads_df):
     """Validate converted data."""
     errors = []
     warnings = []
 
-    if len(annotated_records) != len(annotated_df):
-        errors.append(f"Annotated count mismatch: {len(annotated_records)} vs {len(annotated_df)}")
+    if len(annotated_records) != annotated_summary['rows']:
+        errors.append(f"Annotated count mismatch: {len(annotated_records)} vs {annotated_summary['rows']}")
 
     total_posts = sum(len(posts) for posts in threads_dict.values())
     if total_posts != len(threads_df):
         errors.append(f"Threads post count mismatch: {total_posts} vs {len(threads_df)}")
 
-    annotated_thread_ids = set(r['thread_id'] for r in annotated_records)
-    threads_thread_ids = set(int(k) for k in threads_dict.keys())
+    annotated_thread_ids = annotated_summary['thread_ids']
+    threads_thread_ids = threads_df['thread_id'].dropna().astype('int64').unique()
 
-    missing_in_threads = annotated_thread_ids - threads_thread_ids
-    if missing_in_threads:
+    missing_in_threads = np.setdiff1d(annotated_thread_ids, threads_thread_ids, assume_unique=True)
+    if len(missing_in_threads):
         warnings.append(f"Thread IDs in annotated but not in threads: {len(missing_in_threads)}")
 
+    # Counted on the emitted records, so parse failures and '[ ]'/'null' are included
     empty_vaccine_types = sum(1 for r in annotated_records if not r['vaccine_types'])
     if empty_vaccine_types > 0:
         warnings.append(f"Records with empty vaccine_types: {empty_vaccine_types}")
@@ -219,18 +397,12 @@ def main():
     print(f"  - {THREADS_CSV.name}: OK")
     print()
 
-    # Load CSVs
-    print("Loading CSV files...")
-    annotated_df = pd.read_csv(ANNOTATED_CSV)
-    threads_df = pd.read_csv(THREADS_CSV)
-    print(f"  - Annotated: {len(annotated_df)} rows, {len(annotated_df.columns)} columns")
+    # Load and convert
+    print("Loading and converting CSV files...")
+    annotated_records, parse_errors, annotated_summary = load_and_convert_annotated(ANNOTATED_CSV)
+    threads_df, threads_dict = load_and_convert_threads(THREADS_CSV)
+    print(f"  - Annotated: {annotated_summary['rows']} rows, {annotated_summary['columns']} columns")
     print(f"  - Threads: {len(threads_df)} rows, {len(threads_df.columns)} columns")
-    print()
-
-    # Convert
-    print("Converting data...")
-    annotated_records, parse_errors = convert_annotated(annotated_df)
-    threads_dict = convert_threads(threads_df)
     print(f"  - Annotated records: {len(annotated_records)}")
     print(f"  - Thread groups: {len(threads_dict)}")
     print()
@@ -245,7 +417,7 @@ def main():
 
     # Validate
     print("Validating data...")
-    errors, warnings = validate_data(annotated_records, threads_dict, annotated_df, threads_df)
+    errors, warnings = validate_data(annotated_records, threads_dict, annotated_summary, threads_df)
 
     if errors:
         print("ERRORS:")
@@ -269,23 +441,19 @@ def main():
     print()
 
     print("  [1/3] Saving annotated.json (not encrypted)...")
-    with open(ANNOTATED_JSON, 'w', encoding='utf-8') as f:
-        json.dump(annotated_records, f, ensure_ascii=False, indent=2)
+    ANNOTATED_JSON.write_bytes(orjson.dumps(annotated_records, option=orjson.OPT_INDENT_2))
     annotated_size = ANNOTATED_JSON.stat().st_size / 1024
     print(f"        Size: {annotated_size:.1f} KB")
 
     # Encrypt and save threads
     print("  [2/3] Encrypting threads data...")
-    threads_json_str = json.dumps(threads_dict, ensure_ascii=False)
-    original_size = len(threads_json_str.encode('utf-8')) / 1024 / 1024
+    threads_json = orjson.dumps(threads_dict)
+    original_size = len(threads_json) / 1024 / 1024
     print(f"        Original size: {original_size:.1f} MB")
 
-    encrypted_data, salt, iv = encrypt_data(threads_json_str, password)
-    encrypted_size = len(encrypted_data) / 1024 / 1024
+    salt, iv = encrypt_data(threads_json, password, THREADS_ENCRYPTED)
+    encrypted_size = THREADS_ENCRYPTED.stat().st_size / 1024 / 1024
     print(f"        Encrypted size: {encrypted_size:.1f} MB")
-
-    with open(THREADS_ENCRYPTED, 'w', encoding='utf-8') as f:
-        f.write(encrypted_data)
     print(f"        Saved to: threads.encrypted")
 
     # Save encryption config
@@ -293,7 +461,7 @@ def main():
     config = {
         'salt': salt,
         'iv': iv,
-        'iterations': 100000,
+        'iterations': PBKDF2_ITERATIONS,
         'keySize': 256,
         'algorithm': 'AES-CBC'
     }